@@ -1,62 +1,128 @@
 import socket
 import os
 
+CHUNK_SIZE = 1 << 20  # 每次接收的最大块大小（1 MiB）
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # socket 发送/接收缓冲区大小（4 MiB）
+SOCKET_TIMEOUT_SECONDS = 60  # 连接/收发超时，超时后丢弃该连接，避免一直阻塞
+
+def _recv_exact(s, size):
+    """从 socket 精确读取 size 个字节，连接提前关闭时抛出异常"""
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = s.recv_into(view[received:], size - received)
+        if not n:
+            raise ConnectionError("连接中断")
+        received += n
+    return bytes(data)
+
 def receive_image(s, save_dir='.'):
-    """接收图片并保存"""
+    """
+    接收图片并保存。
+    服务器返回文件不存在/为空时返回 False，连接仍可继续使用；
+    接收过程中出错时抛出异常，此时连接中的数据已错位，调用方应关闭连接。
+    """
     try:
-        # 接收文件名
-        file_name_length = int.from_bytes(s.recv(4), byteorder='big')
+        # 接收文件名（出错时服务器同样会发 8 字节的文件大小 0，需要一并读掉）
+        file_name_length = int.from_bytes(_recv_exact(s, 4), byteorder='big')
         if file_name_length == 0:
+            _recv_exact(s, 8)
             print("服务器返回: 文件不存在或无法读取")
             return False
-        file_name = s.recv(file_name_length).decode('utf-8')
+        file_name = _recv_exact(s, file_name_length).decode('utf-8')
         
         # 接收文件数据
-        file_size = int.from_bytes(s.recv(8), byteorder='big')
+        file_size = int.from_bytes(_recv_exact(s, 8), byteorder='big')
         if file_size == 0:
             print("服务器返回: 文件大小为 0，可能不存在或无法读取")
             return False
         
-        received_data = bytearray()
-        
         print(f"正在接收图片: {file_name} ({file_size} 字节)")
         
-        while len(received_data) < file_size:
-            chunk = s.recv(min(4096, file_size - len(received_data)))
-            if not chunk:
-                raise Exception("连接中断")
-            received_data.extend(chunk)
-        
-        # 保存图片
+        # 边接收边写盘，复用一个 1 MiB 缓冲区，内存占用与图片大小无关。
+        # 先写到临时文件，接收完整后再改名，避免中断时留下不完整的图片被当作已下载
         save_path = os.path.join(save_dir, file_name)
-        with open(save_path, 'wb') as f:
-            f.write(received_data)
+        part_path = save_path + '.part'
+        buffer = bytearray(min(CHUNK_SIZE, file_size))
+        view = memoryview(buffer)
+        received = 0
+        
+        try:
+            with open(part_path, 'wb') as f:
+                while received < file_size:
+                    n = s.recv_into(view, min(len(buffer), file_size - received))
+                    if not n:
+                        raise ConnectionError("连接中断")
+                    f.write(view[:n])
+                    received += n
+            os.replace(part_path, save_path)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
         
         print(f"图片已保存到: {os.path.abspath(save_path)}")
         return True
         
     except Exception as e:
         print(f"接收图片时出错: {e}")
-        return False
+        raise
+
+def connect_server(server_ip, server_port):
+    """连接图片服务器，返回的连接可以连续请求多张图片"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        # 加大 socket 缓冲区，减少大文件接收时的系统调用次数
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        # 关闭 Nagle 算法，避免请求头被延迟发送
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # 设置超时：复用的连接一旦数据错位或服务器无响应，会抛出超时异常而不是一直卡住
+        s.settimeout(SOCKET_TIMEOUT_SECONDS)
+        print(f"正在连接到服务器 {server_ip}:{server_port}...")
+        s.connect((server_ip, server_port))
+        print("已连接到服务器")
+        return s
+    except Exception:
+        s.close()
+        raise
+
+def fetch_image(s, image_name, save_dir='.'):
+    """在已建立的连接上请求并接收一张图片，连接出错时抛出异常"""
+    # 发送请求的图片文件名：长度（按 UTF-8 字节数）+ 路径，一次发出
+    name_bytes = image_name.encode('utf-8')
+    s.sendall(len(name_bytes).to_bytes(4, byteorder='big') + name_bytes)
+    
+    # 接收图片
+    return receive_image(s, save_dir)
+
+def close_connection(s):
+    """发送 0 长度结束标记通知服务器，然后关闭连接"""
+    try:
+        s.sendall((0).to_bytes(4, byteorder='big'))
+    except OSError:
+        pass
+    finally:
+        s.close()
 
 def request_image(server_ip, server_port, image_name, save_dir='.'):
-    """请求并接收图片"""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        try:
-            print(f"正在连接到服务器 {server_ip}:{server_port}...")
-            s.connect((server_ip, server_port))
-            print("已连接到服务器")
-            
-            # 发送请求的图片文件名
-            s.sendall(len(image_name).to_bytes(4, byteorder='big'))
-            s.sendall(image_name.encode('utf-8'))
-            
-            # 接收图片
-            return receive_image(s, save_dir)
-            
-        except Exception as e:
-            print(f"连接服务器时出错: {e}")
-            return False
+    """请求并接收图片（单独建立一次连接）"""
+    try:
+        s = connect_server(server_ip, server_port)
+    except Exception as e:
+        print(f"连接服务器时出错: {e}")
+        return False
+    
+    try:
+        return fetch_image(s, image_name, save_dir)
+    except Exception as e:
+        print(f"连接服务器时出错: {e}")
+        return False
+    finally:
+        close_connection(s)
 
 if __name__ == "__main__":
     # 配置
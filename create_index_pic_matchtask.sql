@@ -0,0 +1,12 @@
+-- 图片同步增量查询使用的组合索引（只需执行一次）
+--
+-- sync_pictures.fetch_new_rows 按 (CREATED_TIME, TASK_ID) 做增量查询并排序：
+--   WHERE CREATED_TIME > :last_time
+--      OR (CREATED_TIME = :last_time AND TASK_ID > :last_task_id)
+--   ORDER BY CREATED_TIME, TASK_ID
+-- 没有该索引时每次轮询都会全表扫描，查询耗时随表的大小增长。
+--
+-- 注意：需要使用对 jlyxz.PIC_MATCHTASK 有建索引权限的账号执行（同步脚本使用的 identify 账号通常没有）。
+
+CREATE INDEX jlyxz.IDX_PIC_MATCHTASK_CT_TID
+    ON jlyxz.PIC_MATCHTASK (CREATED_TIME, TASK_ID);
@@ -56,6 +56,17 @@ def _ensure_oracle_env():
         # 其他未知错误，也使用空字符串
         current_path = ""
 
+    # PATH 长度正常且第一项已经是 Instant Client 时（例如从已经配置过的进程/终端启动），
+    # 下面的去重结果不会改变加载顺序，无需重写 PATH，只设置 TNS_ADMIN 即可。
+    # 注意只能判断第一项：Instant Client 不在最前面时，仍需走去重逻辑把它移到最前，
+    # 避免先加载到其它 Oracle 安装的 oci.dll
+    if current_path and not path_too_long:
+        first_part = current_path.split(";", 1)[0].strip()
+        if first_part.lower() == INSTANTCLIENT_DIR.lower():
+            os.environ["TNS_ADMIN"] = INSTANTCLIENT_NET
+            _ORACLE_ENV_SET = True
+            return
+
     def dedup_path(path_str: str, force_clean=False):
         """
         对 PATH 进行去重处理。
@@ -199,6 +210,8 @@ def connect_to_oracle():
 def export_recent_data(connection, table_name, days=30):
     try:
         cursor = connection.cursor()
+        # 加大预取行数，减少 fetchall 时与数据库的往返次数（cx_Oracle 默认 100）
+        cursor.arraysize = 1000
         
         # 计算日期范围
         end_date = datetime.now()
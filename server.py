@@ -1,18 +1,41 @@
+import asyncio
 import socket
 import os
 import sys
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    # orjson 可选：安装了就用它序列化进度文件，比标准库 json 快很多
+    import orjson
+
+    def _dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _dumps(data):
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
 # 配置参数
 RESTART_DELAY_SECONDS = 10  # 重启前等待的秒数
 MAX_NO_SEND_HOURS = 24  # 超过多少小时没有发送数据就重启（默认24小时）
+RESTART_CHECK_INTERVAL_SECONDS = 60  # 每隔多少秒检查一次是否需要重启
+CHUNK_SIZE = 1 << 20  # 每次从磁盘读取并发送的块大小（1 MiB）
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # socket 发送/接收缓冲区大小（4 MiB）
+IO_WORKERS = 8  # 执行磁盘操作（检查、打开、读取文件，写进度文件）的线程数
 
 # 脚本所在目录，保证无论从哪里运行，进度文件路径都是固定的
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROGRESS_FILE = os.path.join(BASE_DIR, 'server_progress.json')
 
+# 最后一次发送数据的时间戳（内存缓存，避免每次检查都读文件、解析时间）：
+# None 表示尚未从进度文件加载，0.0 表示从未发送过
+_last_send_epoch = None
+_progress_lock = threading.Lock()
+
 
 def load_last_send_time():
     """加载最后一次发送数据的时间"""
@@ -27,33 +50,47 @@ def load_last_send_time():
 
 
 def save_last_send_time():
-    """保存最后一次发送数据的时间"""
-    current_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    """保存最后一次发送数据的时间（同时更新内存缓存）"""
+    global _last_send_epoch
+    now = time.time()
+    _last_send_epoch = now
+    current_time_str = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
     data = {
         'last_send_time': current_time_str,
     }
-    with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # 可能在线程池中被多个发送任务同时调用，加锁避免并发写坏进度文件
+    with _progress_lock:
+        with open(PROGRESS_FILE, 'wb') as f:
+            f.write(_dumps(data))
 
 
-def check_need_restart():
-    """检查是否需要重启（长时间没有发送数据）"""
+def _load_last_send_epoch():
+    """从进度文件加载最后发送时间并转换为时间戳，从未发送或解析失败时返回 0.0"""
     last_send_time = load_last_send_time()
     if last_send_time is None:
-        # 如果从未发送过，不重启（可能是刚启动）
-        return False
-    
+        return 0.0
     try:
-        last_send = datetime.strptime(last_send_time, '%Y-%m-%d %H:%M:%S')
-        now = datetime.now()
-        hours_since_send = (now - last_send).total_seconds() / 3600
-        
-        if hours_since_send >= MAX_NO_SEND_HOURS:
-            print(f"\n警告: 已经 {hours_since_send:.2f} 小时没有向客户端发送任何数据")
-            print(f"超过阈值 {MAX_NO_SEND_HOURS} 小时，将重启服务器...")
-            return True
+        return datetime.strptime(last_send_time, '%Y-%m-%d %H:%M:%S').timestamp()
     except Exception as e:
         print(f"检查发送时间时出错: {e}")
+        return 0.0
+
+
+def check_need_restart():
+    """检查是否需要重启（长时间没有发送数据）"""
+    global _last_send_epoch
+    # 只在第一次检查时读取进度文件，之后直接使用内存中的时间戳
+    if _last_send_epoch is None:
+        _last_send_epoch = _load_last_send_epoch()
+    if not _last_send_epoch:
+        # 如果从未发送过，不重启（可能是刚启动）
+        return False
+    
+    hours_since_send = (time.time() - _last_send_epoch) / 3600
+    if hours_since_send >= MAX_NO_SEND_HOURS:
+        print(f"\n警告: 已经 {hours_since_send:.2f} 小时没有向客户端发送任何数据")
+        print(f"超过阈值 {MAX_NO_SEND_HOURS} 小时，将重启服务器...")
+        return True
     
     return False
 
@@ -69,106 +106,160 @@ def check_file_readable(file_path):
     return True
 
 
-def send_image(conn, file_path):
-    """从服务器读取文件并发送给客户端"""
+def _open_for_send(file_path):
+    """检查文件可读性并打开文件（在线程池中执行），返回 (文件对象, 文件大小)，不可读时返回 (None, 0)"""
+    if not check_file_readable(file_path):
+        return None, 0
+    f = open(file_path, "rb")
+    return f, os.fstat(f.fileno()).st_size
+
+
+async def send_image_async(writer, file_path):
+    """从服务器读取文件并发送给客户端（磁盘读取放到线程池，不阻塞事件循环）"""
+    loop = asyncio.get_running_loop()
     try:
-        # 先检查文件可读性，如果不行，发一个明显的空响应给客户端
-        if not check_file_readable(file_path):
-            # 文件名长度 0
-            conn.sendall((0).to_bytes(4, byteorder="big"))
-            # 文件大小 0
-            conn.sendall((0).to_bytes(8, byteorder="big"))
+        # 先检查文件可读性并打开文件（磁盘操作放到线程池），如果不行，发一个明显的空响应给客户端
+        f, file_size = await loop.run_in_executor(None, _open_for_send, file_path)
+        if f is None:
+            # 文件名长度 0 + 文件大小 0，一次发出
+            writer.write((0).to_bytes(4, byteorder="big") + (0).to_bytes(8, byteorder="big"))
+            await writer.drain()
             return False
 
         file_name = os.path.basename(file_path)
-        file_size = os.path.getsize(file_path)
-
-        # 先发送文件名长度和文件名
-        conn.sendall(len(file_name).to_bytes(4, byteorder="big"))
-        conn.sendall(file_name.encode("utf-8"))
+        name_bytes = file_name.encode("utf-8")
 
-        # 再发送文件大小（8 字节）
-        conn.sendall(file_size.to_bytes(8, byteorder="big"))
+        # 文件名长度（按 UTF-8 字节数）+ 文件名 + 文件大小（8 字节）拼成一个头部一次发出
+        header = (
+            len(name_bytes).to_bytes(4, byteorder="big")
+            + name_bytes
+            + file_size.to_bytes(8, byteorder="big")
+        )
 
         print(f"正在发送文件: {file_path} ({file_size} 字节)")
 
-        # 发送文件内容
-        with open(file_path, "rb") as f:
-            while True:
-                chunk = f.read(4096)
-                if not chunk:
-                    break
-                conn.sendall(chunk)
+        # 发送文件内容：优先使用 sendfile 零拷贝，数据直接从页缓存发到 socket。
+        # 同一连接上还会继续发送后续文件，所以只能发送头部中声明的 file_size 字节：
+        # 文件在发送过程中被追加写入时，多出的字节不能发出去；文件变短时按出错处理并关闭连接
+        with f:
+            writer.write(header)
+            if not file_size:
+                # 空文件只有头部（文件大小 0），没有内容可发；sendfile 不接受 count=0
+                await writer.drain()
+                sent = 0
+            else:
+                try:
+                    sent = await loop.sendfile(writer.transport, f, count=file_size, fallback=False)
+                except asyncio.SendfileNotAvailableError:
+                    # 当前平台/传输不支持 sendfile 时回退到分块读写：
+                    # 读盘在线程池中进行，drain 等待网络发送缓冲区腾空
+                    sent = 0
+                    while sent < file_size:
+                        chunk = await loop.run_in_executor(None, f.read, min(CHUNK_SIZE, file_size - sent))
+                        if not chunk:
+                            break
+                        writer.write(chunk)
+                        await writer.drain()
+                        sent += len(chunk)
+            if sent < file_size:
+                raise Exception(f"文件在发送过程中变短，只发送了 {sent}/{file_size} 字节")
 
         print("文件发送完成")
-        # 成功发送后，更新最后发送时间
-        save_last_send_time()
+        # 成功发送后，更新最后发送时间（写进度文件放到线程池，不阻塞事件循环）
+        await loop.run_in_executor(None, save_last_send_time)
         return True
 
     except Exception as e:
+        # 发送到一半出错时连接中的数据已错位，抛给调用方关闭连接
         print(f"发送文件时出错: {e}")
-        return False
+        raise
 
 
-def start_server(host="0.0.0.0", port=5000):
-    """启动文件/图片发送服务器，客户端发送完整文件路径"""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((host, port))
-        s.listen(5)
+async def handle_client(reader, writer):
+    """处理单个客户端连接：循环读取请求的完整路径并发送对应文件"""
+    addr = writer.get_extra_info("peername")
+    print(f"\n[+] 客户端已连接: {addr}")
 
-        print(f"图片服务器已启动，监听 {host}:{port}")
-        print("客户端需要发送服务器上的 *完整文件路径*")
+    # 加大 socket 缓冲区，减少大文件发送时的系统调用次数
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        # 关闭 Nagle 算法，避免小的头部包被延迟发送
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
-        print("按 Ctrl+C 停止服务器\n")
+    try:
+        # 同一个连接上可以连续请求多个文件，直到客户端关闭连接或发送 0 长度结束标记
+        served = 0
+        while True:
+            # 客户端先发 4 字节“路径字符串”长度
+            try:
+                name_len_bytes = await reader.readexactly(4)
+            except asyncio.IncompleteReadError:
+                if served == 0:
+                    print("未收到文件名长度，关闭连接")
+                break
 
+            path_length = int.from_bytes(name_len_bytes, byteorder="big")
+            if path_length == 0:
+                # 结束标记，客户端不再请求文件
+                break
+            remote_path = (await reader.readexactly(path_length)).decode("utf-8")
+
+            # 直接把客户端发来的完整路径当作服务器本地路径
+            file_path = remote_path
+            print(f"客户端请求文件: {file_path}")
+
+            if await send_image_async(writer, file_path):
+                print("文件发送成功")
+            else:
+                print("文件发送失败")
+            served += 1
+
+    except Exception as e:
+        print(f"处理客户端请求时出错: {e}")
+    finally:
+        writer.close()
         try:
-            while True:
-                # 检查是否需要重启（长时间无发送）
-                if check_need_restart():
-                    print(f"\n等待 {RESTART_DELAY_SECONDS} 秒后重启...")
-                    time.sleep(RESTART_DELAY_SECONDS)
-                    raise Exception("长时间未发送数据，触发重启")
-                
-                conn, addr = s.accept()
-                print(f"\n[+] 客户端已连接: {addr}")
+            await writer.wait_closed()
+        except Exception:
+            pass
+        print(f"[-] 客户端已断开: {addr}")
 
-                try:
-                    # 客户端先发 4 字节“路径字符串”长度
-                    name_len_bytes = conn.recv(4)
-
-                    if not name_len_bytes:
-                        print("未收到文件名长度，关闭连接")
-                        conn.close()
-                        continue
-
-                    path_length = int.from_bytes(name_len_bytes, byteorder="big")
-                    remote_path = conn.recv(path_length).decode("utf-8")
-
-                    # 直接把客户端发来的完整路径当作服务器本地路径
-                    file_path = remote_path
-                    print(f"客户端请求文件: {file_path}")
-
-                    if send_image(conn, file_path):
-
-                        print("文件发送成功")
-                    else:
-                        print("文件发送失败")
-
-                except Exception as e:
-                    print(f"处理客户端请求时出错: {e}")
-                finally:
-                    conn.close()
-                    print(f"[-] 客户端已断开: {addr}")
-
-        except KeyboardInterrupt:
-            print("\n服务器正在关闭...")
-            raise  # 重新抛出 KeyboardInterrupt，让主程序正常退出
-        except Exception as e:
-            print(f"服务器错误: {e}")
-            import traceback
-            traceback.print_exc()
-            raise  # 重新抛出异常，让主程序捕获并重启
+
+async def _serve(host, port):
+    """启动异步监听，并定期检查是否需要重启"""
+    # 磁盘操作统一交给固定大小的线程池，不阻塞事件循环中的连接处理
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=IO_WORKERS))
+    server = await asyncio.start_server(handle_client, host, port, reuse_address=True)
+
+    print(f"图片服务器已启动，监听 {host}:{port}")
+    print("客户端需要发送服务器上的 *完整文件路径*")
+
+    print("按 Ctrl+C 停止服务器\n")
+
+    async with server:
+        while True:
+            # 检查是否需要重启（长时间无发送）
+            if check_need_restart():
+                print(f"\n等待 {RESTART_DELAY_SECONDS} 秒后重启...")
+                await asyncio.sleep(RESTART_DELAY_SECONDS)
+                raise Exception("长时间未发送数据，触发重启")
+            await asyncio.sleep(RESTART_CHECK_INTERVAL_SECONDS)
+
+
+def start_server(host="0.0.0.0", port=5000):
+    """启动文件/图片发送服务器，客户端发送完整文件路径（asyncio，多客户端并发）"""
+    try:
+        asyncio.run(_serve(host, port))
+    except KeyboardInterrupt:
+        print("\n服务器正在关闭...")
+        raise  # 重新抛出 KeyboardInterrupt，让主程序正常退出
+    except Exception as e:
+        print(f"服务器错误: {e}")
+        import traceback
+        traceback.print_exc()
+        raise  # 重新抛出异常，让主程序捕获并重启
 
 
 def restart_program():
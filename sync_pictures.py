@@ -8,14 +8,15 @@
 
 ### 1. 增量数据同步
 - 从 `jlyxz.PIC_MATCHTASK` 表查询新的任务记录
-- 支持基于 `CREATED_TIME` 和 `TASK_ID` 的增量查询
+- 支持基于 `CREATED_TIME` 和 `TASK_ID` 的增量查询（走组合索引，每批最多 5000 条）
 - 自动保存处理进度，支持断点续传
 
 ### 2. 图片下载
 - 支持下载每个任务的 8 张图片（4 张 TARE 图片 + 4 张 GROSS 图片）
 - 自动创建本地目录结构
 - 跳过已存在的文件，避免重复下载
-- 通过 TCP Socket 从服务器下载图片文件
+- 通过 TCP Socket 从服务器下载图片文件，同一条记录的图片多线程并发下载
+- 一次轮询内复用到服务器的 TCP 连接，不再每张图片重新建立连接
 
 ### 3. 自动重启机制
 - **宕机自动重启**：捕获所有未处理的异常，自动重启程序
@@ -26,15 +27,17 @@
 
 - `MAX_NO_DOWNLOAD_HOURS = 2`：超过多少小时没有下载就重启（默认 2 小时）
 - `RESTART_DELAY_SECONDS = 10`：重启前等待的秒数
+- `DOWNLOAD_WORKERS = 8`：每条记录并发下载图片的线程数
+- `FIRST_RUN_LOOKBACK_DAYS = 7`：没有历史进度时，从最近多少天的记录开始同步
 - `LOCAL_ROOT = 'D:\\'`：本地保存根目录
 - `PROGRESS_FILE`：进度文件路径，保存最后处理的时间和任务ID
 
 ## 工作流程
 
-1. 启动服务，每 300 秒（5分钟）轮询一次数据库
+1. 启动服务，每 300 秒（5分钟）轮询一次数据库（数据库连接在多次轮询之间复用）
 2. 查询新的任务记录（基于上次处理进度）
 3. 对每条记录，下载所有相关的图片文件
-4. 每处理完一条记录，立即保存进度
+4. 每处理完一条记录更新进度，每 50 条或每 5 秒批量写盘一次（轮询结束、退出、重启前强制写盘）
 5. 每次轮询前检查是否需要重启（长时间无下载）
 6. 发生异常时自动重启程序
 
@@ -59,16 +62,27 @@ import os
 import json
 import time
 import sys
+import signal
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
-import pandas as pd
-
-from client import request_image
+from client import connect_server, fetch_image, close_connection
 
 
 from data_output import connect_to_oracle
 
+try:
+    # 有 orjson 时用它序列化进度，没有则回退到标准库 json
+    import orjson
+
+    def _dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _dumps(data):
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
 
 # 脚本所在目录，保证无论从哪里运行，进度文件路径都是固定的
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -80,9 +94,39 @@ LOCAL_ROOT = 'D:\\'
 # 配置参数
 MAX_NO_DOWNLOAD_HOURS = 2  # 超过多少小时没有下载就重启（默认2小时）
 RESTART_DELAY_SECONDS = 10  # 重启前等待的秒数
+DOWNLOAD_WORKERS = 8  # 每条记录并发下载图片的线程数
+FETCH_ARRAY_SIZE = 1000  # 每次从数据库预取的行数（cx_Oracle 默认 100）
+FETCH_BATCH_SIZE = 5000  # 每次轮询最多处理的记录数，超过的部分下一批继续处理
+IMAGE_PATH_COLUMNS = [
+    'TARE_IMAGE_PATH1', 'TARE_IMAGE_PATH2', 'TARE_IMAGE_PATH3', 'TARE_IMAGE_PATH4',
+    'GROSS_IMAGE_PATH1', 'GROSS_IMAGE_PATH2', 'GROSS_IMAGE_PATH3', 'GROSS_IMAGE_PATH4',
+]  # 每条任务记录中需要下载的图片路径列
+FIRST_RUN_LOOKBACK_DAYS = 7  # 没有历史进度时，从最近多少天的记录开始同步
+PROGRESS_FLUSH_SECONDS = 5.0  # 进度最多在内存中缓存多少秒再写盘
+PROGRESS_FLUSH_ROWS = 50  # 进度最多累计多少次更新再写盘
+
+# 内存中的最新进度。进度不再每处理一条记录就写一次文件，而是按时间/条数批量写盘，
+# 轮询结束、程序退出或重启前会强制写盘
+_progress = None
+_progress_pending = 0
+_progress_last_flush = time.monotonic()
+
+# 最后一次成功下载的时间戳（内存缓存，避免每次检查都读进度文件、解析时间）：
+# None 表示尚未从进度文件加载，0.0 表示从未下载过
+_last_download_epoch = None
+
+# 已经创建过的本地目录，避免对同一目录重复调用 os.makedirs
+_made_dirs = set()
+
+# 空闲的图片服务器连接，按 (ip, port) 分组，一次轮询内在多条记录、多张图片之间复用，
+# 避免每张图片都重新建立 TCP 连接；轮询结束时统一关闭
+_idle_connections = {}
+_connections_lock = threading.Lock()
 
 
 def load_progress():
+    if _progress is not None:
+        return _progress.get('last_created_time'), _progress.get('last_task_id'), _progress.get('last_download_time')
     if not os.path.exists(PROGRESS_FILE):
         return None, None, None
     try:
@@ -94,24 +138,52 @@ def load_progress():
 
 
 def save_progress(created_time_str, task_id, download_time_str=None):
+    """更新内存中的进度，累计到一定时间或条数后才写盘"""
+    global _progress, _progress_pending
+    _, _, last_download_time = load_progress()
     data = {
         'last_created_time': created_time_str,
         'last_task_id': task_id,
     }
+    # 没有传入下载时间时沿用已有的，避免更新处理进度时把最后下载时间丢掉
+    download_time_str = download_time_str or last_download_time
     if download_time_str:
         data['last_download_time'] = download_time_str
-    with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if data == _progress:
+        return
+
+    _progress = data
+    _progress_pending += 1
+    if (_progress_pending >= PROGRESS_FLUSH_ROWS
+            or time.monotonic() - _progress_last_flush >= PROGRESS_FLUSH_SECONDS):
+        flush_progress()
+
+
+def flush_progress():
+    """把内存中的进度写入进度文件：先写临时文件再 os.replace，保证文件始终完整"""
+    global _progress_pending, _progress_last_flush
+    if _progress is None or not _progress_pending:
+        return
+    tmp_file = PROGRESS_FILE + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(_dumps(_progress))
+    os.replace(tmp_file, PROGRESS_FILE)
+    _progress_pending = 0
+    _progress_last_flush = time.monotonic()
 
 
 def update_download_time():
-    """更新最后一次下载时间"""
+    """更新最后一次下载时间（同时更新内存缓存）"""
+    global _last_download_epoch
+    now = time.time()
+    _last_download_epoch = now
     last_created_time, last_task_id, _ = load_progress()
-    current_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    current_time_str = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
     save_progress(last_created_time, last_task_id, current_time_str)
 
 
-def ensure_local_path(remote_path):
+def local_path_for(remote_path):
+    """把服务器路径映射为本地保存路径（纯字符串计算，不访问磁盘）"""
     drive, path_without_drive = os.path.splitdrive(remote_path)
     rel_path = path_without_drive.lstrip('\\/')
     # 如果 LOCAL_ROOT 是类似 "D:" 这样的盘符，拼成真正的根目录 "D:\\"
@@ -120,57 +192,114 @@ def ensure_local_path(remote_path):
     else:
         base = LOCAL_ROOT
 
-    local_path = os.path.join(base, rel_path)
-    os.makedirs(os.path.dirname(local_path), exist_ok=True)
-    return local_path
+    return os.path.join(base, rel_path)
+
+
+def ensure_local_path(remote_path):
+    """计算本地保存路径，并确保其所在目录存在，返回 (本地文件路径, 所在目录)"""
+    local_path = local_path_for(remote_path)
+    local_dir = os.path.dirname(local_path)
+    if local_dir not in _made_dirs:
+        os.makedirs(local_dir, exist_ok=True)
+        _made_dirs.add(local_dir)
+    return local_path, local_dir
 
 
 def fetch_new_rows(connection, last_created_time, last_task_id):
+    # 走 (CREATED_TIME, TASK_ID) 组合索引（见 create_index_pic_matchtask.sql），
+    # 按索引顺序范围扫描，避免全表扫描和排序
     base_sql = """
-    SELECT TASK_ID,
+    SELECT /*+ INDEX(t IDX_PIC_MATCHTASK_CT_TID) */
+           TASK_ID,
            CREATED_TIME,
            TARE_IMAGE_PATH1, TARE_IMAGE_PATH2, TARE_IMAGE_PATH3, TARE_IMAGE_PATH4,
            GROSS_IMAGE_PATH1, GROSS_IMAGE_PATH2, GROSS_IMAGE_PATH3, GROSS_IMAGE_PATH4
-    FROM jlyxz.PIC_MATCHTASK
+    FROM jlyxz.PIC_MATCHTASK t
     """
 
     if last_created_time is None:
-        where_clause = ""
-        params = {}
+        # 首次运行（或进度文件丢失）时不拉全表，只从最近 FIRST_RUN_LOOKBACK_DAYS 天开始，
+        # 同样走下面的索引范围查询
+        last_time = datetime.now() - timedelta(days=FIRST_RUN_LOOKBACK_DAYS)
+        last_task_id = '0'
+        print(f"没有历史进度，从 {last_time.strftime('%Y-%m-%d %H:%M:%S')} 开始同步")
     else:
-        where_clause = """
-        WHERE (CREATED_TIME > :last_time)
-           OR (CREATED_TIME = :last_time AND TASK_ID > :last_task_id)
-        """
-        params = {
-            'last_time': datetime.strptime(last_created_time, '%Y-%m-%d %H:%M:%S'),
-            'last_task_id': last_task_id or '0',
-        }
-
-    order_clause = "ORDER BY CREATED_TIME, TASK_ID"
+        last_time = datetime.strptime(last_created_time, '%Y-%m-%d %H:%M:%S')
+
+    where_clause = """
+    WHERE (CREATED_TIME > :last_time)
+       OR (CREATED_TIME = :last_time AND TASK_ID > :last_task_id)
+    """
+    params = {
+        'last_time': last_time,
+        'last_task_id': last_task_id or '0',
+    }
+
+    # 限制每批行数，控制单次轮询的工作量
+    order_clause = f"ORDER BY CREATED_TIME, TASK_ID FETCH FIRST {FETCH_BATCH_SIZE} ROWS ONLY"
     sql = "\n".join([base_sql, where_clause, order_clause])
 
     cursor = connection.cursor()
+    # 加大预取行数，减少与数据库的往返次数
+    cursor.arraysize = FETCH_ARRAY_SIZE
     cursor.execute(sql, **params)
     columns = [c[0] for c in cursor.description]
-    data = cursor.fetchall()
-    cursor.close()
 
-    if not data:
-        return pd.DataFrame(columns=columns)
+    # 直接返回游标，由调用方逐行迭代（用完后需要关闭游标），不再构造 DataFrame
+    return cursor, columns
+
+
+def _acquire_connection(server_ip, server_port):
+    """取一个空闲连接，没有则新建；返回 (连接, 是否为复用的连接)"""
+    with _connections_lock:
+        idle = _idle_connections.get((server_ip, server_port))
+        if idle:
+            return idle.pop(), True
+    return connect_server(server_ip, server_port), False
+
+
+def _release_connection(server_ip, server_port, s):
+    """把用完的连接放回空闲列表"""
+    with _connections_lock:
+        _idle_connections.setdefault((server_ip, server_port), []).append(s)
 
-    return pd.DataFrame(data, columns=columns)
 
+def close_idle_connections():
+    """关闭所有空闲连接（发送结束标记通知服务器）"""
+    with _connections_lock:
+        connections = [s for idle in _idle_connections.values() for s in idle]
+        _idle_connections.clear()
+    for s in connections:
+        close_connection(s)
 
-def download_for_row(row, server_ip='10.100.2.229', server_port=5000):
-    paths = [
-        row.get('TARE_IMAGE_PATH1'), row.get('TARE_IMAGE_PATH2'),
-        row.get('TARE_IMAGE_PATH3'), row.get('TARE_IMAGE_PATH4'),
-        row.get('GROSS_IMAGE_PATH1'), row.get('GROSS_IMAGE_PATH2'),
-        row.get('GROSS_IMAGE_PATH3'), row.get('GROSS_IMAGE_PATH4'),
-    ]
 
+def download_image(server_ip, server_port, remote_path, save_dir):
+    """复用空闲连接下载一张图片；连接出错时丢弃该连接"""
+    while True:
+        try:
+            s, reused = _acquire_connection(server_ip, server_port)
+        except Exception as e:
+            print(f"连接服务器时出错: {e}")
+            return False
+
+        try:
+            success = fetch_image(s, remote_path, save_dir)
+        except Exception as e:
+            s.close()
+            if reused:
+                # 复用的连接可能已被服务器关闭（例如服务器重启），换一个新连接重试
+                continue
+            print(f"连接服务器时出错: {e}")
+            return False
+
+        _release_connection(server_ip, server_port, s)
+        return success
+
+
+def download_for_row(paths, server_ip='10.100.2.229', server_port=5000):
+    """下载一条任务记录的所有图片，paths 为该记录 IMAGE_PATH_COLUMNS 各列的值"""
     has_successful_download = False
+    pending = []
 
     for remote_path in paths:
         if not remote_path or not isinstance(remote_path, str):
@@ -180,59 +309,97 @@ def download_for_row(row, server_ip='10.100.2.229', server_port=5000):
         if not remote_path:
             continue
 
-        local_path = ensure_local_path(remote_path)
-        if os.path.exists(local_path) and os.path.getsize(local_path) > 0:
-            print(f"已存在，跳过: {local_path}")
+        # 先只计算路径判断是否已下载，已下载的文件不创建目录、不建立连接
+        local_path = local_path_for(remote_path)
+        # 一次 os.stat 同时判断文件是否存在以及大小
+        try:
+            if os.stat(local_path).st_size > 0:
+                print(f"已存在，跳过: {local_path}")
+                continue
+        except FileNotFoundError:
+            pass
+        if any(queued == remote_path for queued, _ in pending):
+            # 同一条记录里重复的路径只下载一次，避免多个线程同时写同一个文件
             continue
 
-        save_dir = os.path.dirname(local_path)
-        os.makedirs(save_dir, exist_ok=True)
+        local_path, save_dir = ensure_local_path(remote_path)
 
         print(f"请求服务器文件: {remote_path}")
         print(f"本地保存到: {local_path}")
-
-        success = request_image(server_ip, server_port, remote_path, save_dir)
-        if not success:
-            print(f"下载失败: {remote_path}")
-        else:
-            print(f"下载成功: {remote_path}")
-            has_successful_download = True
+        pending.append((remote_path, save_dir))
+
+    # 下载以网络/磁盘 I/O 为主，多线程并发下载同一条记录的所有图片
+    if pending:
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            futures = {
+                executor.submit(download_image, server_ip, server_port, remote_path, save_dir): (remote_path, save_dir)
+                for remote_path, save_dir in pending
+            }
+            for future in as_completed(futures):
+                remote_path, save_dir = futures[future]
+                if not future.result():
+                    print(f"下载失败: {remote_path}")
+                    # 目录可能在运行期间被删除，失败后下次重新检查/创建
+                    _made_dirs.discard(save_dir)
+                else:
+                    print(f"下载成功: {remote_path}")
+                    has_successful_download = True
 
     # 如果有成功下载，更新下载时间
     if has_successful_download:
         update_download_time()
 
 
-def run_once():
-    """执行一次从数据库增量拉取并下载图片的流程"""
+def ensure_oracle_connection(connection):
+    """
+    复用上一次的数据库连接：先 ping 检查是否可用，不可用时关闭并重新连接。
+    返回可用的连接，连接失败时返回 None。
+    """
+    if connection is not None:
+        try:
+            connection.ping()
+            return connection
+        except Exception as e:
+            print(f"数据库连接已失效（{e}），重新连接...")
+            try:
+                connection.close()
+            except Exception:
+                pass
+    return connect_to_oracle()
+
+
+def run_once(connection):
+    """使用给定的数据库连接执行一次增量拉取并下载图片的流程，返回本次处理的记录数"""
     last_created_time, last_task_id, last_download_time = load_progress()
     print(f"当前进度: last_created_time={last_created_time}, last_task_id={last_task_id}")
     print(f"最后下载时间: {last_download_time}")
 
-    connection = connect_to_oracle()
     if not connection:
         print("无法连接到数据库，本次轮询结束")
-        return
+        return 0
 
+    cursor = None
     try:
-        df = fetch_new_rows(connection, last_created_time, last_task_id)
-        if df.empty:
-            print("没有新的记录需要处理")
-            return
-
-        print(f"本次需处理 {len(df)} 条记录")
+        cursor, columns = fetch_new_rows(connection, last_created_time, last_task_id)
 
         latest_created_time = last_created_time
         latest_task_id = last_task_id
+        row_count = 0
 
-        for _, row in df.iterrows():
-            created_time = row['CREATED_TIME']
-            task_id = str(row['TASK_ID'])
+        # 列位置只计算一次，逐行直接按下标取值，不再为每行构造 dict
+        task_id_index = columns.index('TASK_ID')
+        created_time_index = columns.index('CREATED_TIME')
+        path_indexes = [columns.index(c) for c in IMAGE_PATH_COLUMNS]
+
+        for row in cursor:
+            row_count += 1
+            created_time = row[created_time_index]
+            task_id = str(row[task_id_index])
 
             print("\n" + "=" * 60)
             print(f"处理 TASK_ID={task_id}, CREATED_TIME={created_time}")
 
-            download_for_row(row)
+            download_for_row([row[i] for i in path_indexes])
 
             if isinstance(created_time, datetime):
                 created_time_str = created_time.strftime('%Y-%m-%d %H:%M:%S')
@@ -243,31 +410,48 @@ def run_once():
             latest_task_id = task_id
             save_progress(latest_created_time, latest_task_id)
 
-        print("\n本次处理完成")
+        if row_count == 0:
+            print("没有新的记录需要处理")
+            return 0
+
+        print(f"\n本次处理完成，共处理 {row_count} 条记录")
         print(f"最新进度: last_created_time={latest_created_time}, last_task_id={latest_task_id}")
+        return row_count
 
     finally:
-        connection.close()
+        close_idle_connections()
+        if cursor is not None:
+            cursor.close()
+        flush_progress()
 
 
-def check_need_restart():
-    """检查是否需要重启（长时间没有下载）"""
+def _load_last_download_epoch():
+    """从进度文件加载最后下载时间并转换为时间戳，从未下载或解析失败时返回 0.0"""
     _, _, last_download_time = load_progress()
     if last_download_time is None:
-        # 如果从未下载过，不重启
-        return False
-    
+        return 0.0
     try:
-        last_download = datetime.strptime(last_download_time, '%Y-%m-%d %H:%M:%S')
-        now = datetime.now()
-        hours_since_download = (now - last_download).total_seconds() / 3600
-        
-        if hours_since_download >= MAX_NO_DOWNLOAD_HOURS:
-            print(f"\n警告: 已经 {hours_since_download:.2f} 小时没有下载任何文件")
-            print(f"超过阈值 {MAX_NO_DOWNLOAD_HOURS} 小时，将重启程序...")
-            return True
+        return datetime.strptime(last_download_time, '%Y-%m-%d %H:%M:%S').timestamp()
     except Exception as e:
         print(f"检查下载时间时出错: {e}")
+        return 0.0
+
+
+def check_need_restart():
+    """检查是否需要重启（长时间没有下载）"""
+    global _last_download_epoch
+    # 只在第一次检查时读取进度文件，之后直接使用内存中的时间戳
+    if _last_download_epoch is None:
+        _last_download_epoch = _load_last_download_epoch()
+    if not _last_download_epoch:
+        # 如果从未下载过，不重启
+        return False
+    
+    hours_since_download = (time.time() - _last_download_epoch) / 3600
+    if hours_since_download >= MAX_NO_DOWNLOAD_HOURS:
+        print(f"\n警告: 已经 {hours_since_download:.2f} 小时没有下载任何文件")
+        print(f"超过阈值 {MAX_NO_DOWNLOAD_HOURS} 小时，将重启程序...")
+        return True
     
     return False
 
@@ -277,6 +461,11 @@ def main(poll_interval_seconds: int = 300):
     print(f"启动图片同步轮询服务，每 {poll_interval_seconds} 秒检查一次新数据...")
     print(f"配置: 超过 {MAX_NO_DOWNLOAD_HOURS} 小时无下载将自动重启")
     
+    # 收到 SIGTERM 时按正常退出处理，确保 finally 中把进度写盘
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # 数据库连接在多次轮询之间复用，避免每次轮询都重新建立连接
+    connection = None
     try:
         while True:
             # 检查是否需要重启（长时间无下载）
@@ -287,7 +476,12 @@ def main(poll_interval_seconds: int = 300):
             
             print("\n" + "#" * 60)
             print(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "开始一次轮询...")
-            run_once()
+            connection = ensure_oracle_connection(connection)
+            row_count = run_once(connection)
+            if row_count >= FETCH_BATCH_SIZE:
+                # 本批已达上限，说明还有积压的记录，不休眠直接拉取下一批
+                print(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "本批记录已达上限，继续拉取下一批...")
+                continue
             print(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "本次轮询结束，进入休眠...")
             time.sleep(poll_interval_seconds)
     except KeyboardInterrupt:
@@ -299,6 +493,13 @@ def main(poll_interval_seconds: int = 300):
         print(f"\n等待 {RESTART_DELAY_SECONDS} 秒后自动重启...")
         time.sleep(RESTART_DELAY_SECONDS)
         restart_program()
+    finally:
+        flush_progress()
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
 
 
 def restart_program():
@@ -307,6 +508,12 @@ def restart_program():
     print("正在重启程序...")
     print("=" * 60 + "\n")
     
+    # 新进程启动时会读取进度文件，先把内存中的进度写盘
+    try:
+        flush_progress()
+    except Exception as e:
+        print(f"保存进度时出错: {e}")
+    
     # 构建清理后的环境变量字典
     new_env = os.environ.copy()
     